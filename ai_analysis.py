@@ -1,12 +1,31 @@
 import base64
+import io
+import json
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import NamedTuple
 
-EXTRACTION_SYSTEM_PROMPT = (
+# Тайлинг высоких скринов: полосы по ~TILE_HEIGHT px с перекрытием TILE_OVERLAP px
+TILE_HEIGHT = 1400
+TILE_OVERLAP = 120
+TILE_WORKERS = 4
+MIN_TILE_HEIGHT = 200   # меньше — полосы бессмысленно узкие (и разрезка может не продвигаться)
+GAP_SPREAD = 8          # строка пикселей «пустая», если max-min яркости не больше этого
+
+# общая часть системного промпта для обоих режимов
+_EXTRACTION_RULES = (
     "Ты — строгий экстрактор табличных данных со скриншотов экономического календаря. "
     "Твоя задача — ТОЛЬКО извлечь видимые на изображении значения без догадок и без внешних знаний. "
     "Нужны столбцы: Дата | Показатель | Факт | Прогноз | Предыдущий. "
     "Синонимы столбцов: Факт=Actual=Актуальное, Прогноз=Forecast=Ожидания, Предыдущий=Previous=Prior. "
     "Включай только те строки, где есть хотя бы одно число (факт/прогноз/предыдущий). "
+)
+
+EXTRACTION_SYSTEM_PROMPT = _EXTRACTION_RULES + (
     "Если ни одной строки извлечь нельзя, верни текст: Нет распознаваемых показателей на скриншоте. "
     "Никаких комментариев или выводов, только таблица."
 )
@@ -23,49 +42,404 @@ EXTRACTION_USER_PROMPT = (
     "• Максимум 20 строк."
 )
 
+EXTRACTION_TILE_USER_PROMPT = (
+    "Это горизонтальная полоса длинной страницы. Извлеки данные в формате Markdown:\n\n"
+    "Дата | Показатель | Факт | Прогноз | Предыдущий |\n"
+    "|---|---:|---:|---:|\n"
+    "<СТРОКИ>\n\n"
+    "Требования:\n"
+    "• Пиши ровно как на скриншоте (проценты, знаки, k, m).\n"
+    "• Если ячейка пустая — оставляй пустой столбец.\n"
+    "• Строки, обрезанные верхним или нижним краем изображения, пропускай.\n"
+    "• Не добавляй текст до и после таблицы."
+)
+
+# JSON-режим: тот же экстрактор, но без требований «верни текст»/«только таблица»,
+# которые противоречат строгой JSON-схеме ответа
+EXTRACTION_JSON_SYSTEM_PROMPT = _EXTRACTION_RULES + "Отвечай только JSON по заданной схеме."
+
+# JSON-режим: короткие ключи и строки-массивы — меньше выходных токенов, чем Markdown
+EXTRACTION_JSON_USER_PROMPT = (
+    "Верни только JSON вида {\"r\": [[дата, показатель, факт, прогноз, предыдущий], ...]}.\n"
+    "Требования:\n"
+    "• Значения — строки ровно как на скриншоте (проценты, знаки, k, m).\n"
+    "• Пустая ячейка — пустая строка \"\".\n"
+    "• Если строк нет — {\"r\": []}."
+)
+EXTRACTION_JSON_TILE_NOTE = (
+    "\n• Это полоса длинной страницы: строки, обрезанные верхним или нижним краем, пропускай."
+)
+EXTRACTION_JSON_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "calendar_rows",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "r": {"type": "array", "items": {"type": "array", "items": {"type": "string"}}},
+            },
+            "required": ["r"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+NO_ROWS = "Нет распознаваемых показателей на скриншоте."
+# пометка неполного результата тайлинга (часть полос упала) — такой результат не кэшируется
+PARTIAL_NOTE = "⚠️ Неполный результат:"
+SEPARATOR_RE = re.compile(r"^\|?\s*:?-{3,}")
+MARKDOWN_HEADER = (
+    "| Дата | Показатель | Факт | Прогноз | Предыдущий |\n"
+    "|---|---|---:|---:|---:|"
+)
+
+# повтор JSON-запроса, обрезанного по max_tokens
+JSON_RETRY_MAX_TOKENS = 4000
+
+# журнал вызовов модели (токены/задержка) — для сравнения режимов
+CALL_LOG: deque = deque(maxlen=500)
+_call_log_lock = threading.Lock()
+
+
+class CalendarRow(NamedTuple):
+    date: str
+    name: str
+    actual: str
+    forecast: str
+    previous: str
+
+
+def _salvage_json_items(content: str) -> list:
+    """Из обрезанного ответа {"r": [[...], [...], [.. достаёт все целиком пришедшие строки."""
+    key = content.find('"r"')
+    start = content.find("[", key) if key >= 0 else -1
+    if start < 0:
+        raise ValueError("ответ без массива 'r'")
+
+    decoder = json.JSONDecoder()
+    items = []
+    pos = start + 1
+    while True:
+        while pos < len(content) and content[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(content) or content[pos] != "[":
+            return items
+        try:
+            item, pos = decoder.raw_decode(content, pos)
+        except ValueError:
+            return items
+        items.append(item)
+
+
+def parse_json_rows(content: str) -> list[CalendarRow]:
+    """
+    Валидирует ответ JSON-режима в типизированные строки. Строки без значений отбрасываются.
+    Обрезанный (невалидный) JSON не роняет разбор: возвращаются строки, пришедшие целиком.
+    """
+    try:
+        data = json.loads(content)
+        raw = data.get("r") if isinstance(data, dict) else None
+    except ValueError:
+        raw = _salvage_json_items(content)
+    if not isinstance(raw, list):
+        raise ValueError("ответ без массива 'r'")
+
+    rows = []
+    for item in raw:
+        if not isinstance(item, list):
+            continue
+        cells = [str(c).strip() for c in item[:5]]
+        cells += [""] * (5 - len(cells))
+        row = CalendarRow(*cells)
+        if row.actual or row.forecast or row.previous:
+            rows.append(row)
+    return rows
+
+
+def render_markdown(rows: list[CalendarRow]) -> str:
+    """Локальный рендер строк в Markdown-таблицу (для Telegram)."""
+    if not rows:
+        return ""
+    body = ["| " + " | ".join(c.replace("|", "/") for c in row) + " |" for row in rows]
+    return "\n".join([MARKDOWN_HEADER] + body)
+
+
+def _record_call(mode: str, model: str, resp, latency: float, tile: bool):
+    usage = getattr(resp, "usage", None)
+    with _call_log_lock:
+        CALL_LOG.append({
+            "ts": time.time(),
+            "mode": mode,
+            "model": model,
+            "tile": tile,
+            "latency_ms": latency * 1000,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        })
+
+
+def extraction_stats() -> dict:
+    """
+    Средние токены/задержка по (режим, полоса ли это). Вызовы по полосам и по целому
+    скрину считаются отдельно — иначе сравнение json vs markdown искажается при CAL_TILED=1.
+    """
+    with _call_log_lock:
+        calls = list(CALL_LOG)
+    out = {}
+    for key in sorted({(c["mode"], c["tile"]) for c in calls}):
+        cs = [c for c in calls if (c["mode"], c["tile"]) == key]
+        n = len(cs)
+        out[key] = {
+            "calls": n,
+            "avg_latency_ms": sum(c["latency_ms"] for c in cs) / n,
+            "avg_prompt_tokens": sum(c["prompt_tokens"] for c in cs) / n,
+            "avg_completion_tokens": sum(c["completion_tokens"] for c in cs) / n,
+        }
+    return out
+
+
+def _chat(client, image_bytes: bytes, model: str, user_prompt: str, max_tokens: int,
+          mode: str, tile: bool, **extra) -> tuple[str, str | None]:
+    """Один запрос к vision-модели; пишет токены и задержку в CALL_LOG. Возвращает (текст, finish_reason)."""
+    b64 = base64.b64encode(image_bytes).decode()
+    system_prompt = EXTRACTION_JSON_SYSTEM_PROMPT if mode == "json" else EXTRACTION_SYSTEM_PROMPT
+    t0 = time.perf_counter()
+    resp = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": user_prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/png;base64,{b64}"},
+                    },
+                ],
+            },
+        ],
+        temperature=0.0,
+        max_tokens=max_tokens,
+        **extra,
+    )
+    _record_call(mode, model, resp, time.perf_counter() - t0, tile)
+    choice = resp.choices[0]
+    return (choice.message.content or "").strip(), choice.finish_reason
+
+
+def _request_table(client, image_bytes: bytes, model: str, user_prompt: str, max_tokens: int,
+                   tile: bool = False) -> str:
+    """Markdown-режим. Возвращает строки таблицы (или '' если строк нет)."""
+    content, _ = _chat(client, image_bytes, model, user_prompt, max_tokens, "markdown", tile)
+    if "Нет распознаваемых показателей" in content:
+        return ""
+
+    # Вырезаем только блок таблицы
+    lines = [ln for ln in content.splitlines() if ln.strip()]
+    return "\n".join(ln for ln in lines if ln.strip().startswith("|"))
+
+
+def _request_rows_json(client, image_bytes: bytes, model: str, max_tokens: int,
+                       tile: bool = False) -> list[CalendarRow]:
+    """
+    JSON-режим: ответ по компактной схеме, валидируется в CalendarRow.
+    Если ответ упёрся в max_tokens — один повтор с бо́льшим бюджетом; если и он обрезан,
+    берём строки, которые успели прийти целиком.
+    """
+    prompt = EXTRACTION_JSON_USER_PROMPT + (EXTRACTION_JSON_TILE_NOTE if tile else "")
+    content, finish = _chat(
+        client, image_bytes, model, prompt, max_tokens, "json", tile,
+        response_format=EXTRACTION_JSON_SCHEMA,
+    )
+    if finish == "length" and max_tokens < JSON_RETRY_MAX_TOKENS:
+        content, finish = _chat(
+            client, image_bytes, model, prompt, JSON_RETRY_MAX_TOKENS, "json", tile,
+            response_format=EXTRACTION_JSON_SCHEMA,
+        )
+    rows = parse_json_rows(content)
+    if finish == "length":
+        print(f"[extract] json truncated at max_tokens, kept {len(rows)} complete rows")
+    return rows
+
+
+def _extract(client, image_bytes: bytes, model: str, mode: str, tile: bool) -> str:
+    """Извлечение в выбранном режиме; результат всегда Markdown-таблица (или '')."""
+    if mode == "json":
+        return render_markdown(_request_rows_json(client, image_bytes, model, 1500, tile))
+    if tile:
+        return _request_table(client, image_bytes, model, EXTRACTION_TILE_USER_PROMPT, 1500, tile)
+    return _request_table(client, image_bytes, model, EXTRACTION_USER_PROMPT, 800)
+
+
 def analyze_calendar_image_openai(
     png_path: Path,
     api_key: str,
     model: str = "gpt-4o-mini",
+    mode: str = "markdown",
 ) -> str:
+    """mode: 'markdown' — таблица текстом от модели; 'json' — компактная схема + локальный рендер."""
     if not api_key:
         return "ℹ️ Анализ отключён: OPENAI_API_KEY не задан."
 
     try:
         from openai import OpenAI
         client = OpenAI(api_key=api_key)
-        b64 = base64.b64encode(png_path.read_bytes()).decode()
-
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": EXTRACTION_SYSTEM_PROMPT},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": EXTRACTION_USER_PROMPT},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{b64}"},
-                        },
-                    ],
-                },
-            ],
-            
-            temperature=0.0,
-            max_tokens=800,
-        )
+        table = _extract(client, png_path.read_bytes(), model, mode, tile=False)
+        return table or NO_ROWS
+    except Exception as e:
+        return f"⚠️ Ошибка анализа: {e}"
+
+
+# ---------- Тайлинг высоких скринов ----------
+
+def _gap_rows(gray) -> list[bool]:
+    """Для каждой строки пикселей: однотонная ли она (промежуток/разделитель между строками таблицы)."""
+    w, h = gray.size
+    small = gray.resize((min(w, 256), h)) if w > 256 else gray
+    sw = small.size[0]
+    data = small.tobytes()
+    gaps = []
+    for y in range(h):
+        row = data[y * sw:(y + 1) * sw]
+        gaps.append(max(row) - min(row) <= GAP_SPREAD)
+    return gaps
+
+
+def _nearest_gap(gaps: list[bool], target: int, lo: int, hi: int) -> int:
+    """Ближайшая к target однотонная строка в [lo, hi); если нет — сам target."""
+    for d in range(0, max(target - lo, hi - target) + 1):
+        for y in (target - d, target + d):
+            if lo <= y < hi and gaps[y]:
+                return y
+    return target
+
+
+def split_into_strips(height: int, gaps: list[bool], tile_height: int, overlap: int) -> list[tuple[int, int]]:
+    """Режет [0, height) на полосы ~tile_height с перекрытием overlap, границы — по промежуткам между строками."""
+    if tile_height < MIN_TILE_HEIGHT:
+        raise ValueError(f"tile_height должен быть не меньше {MIN_TILE_HEIGHT}")
+    overlap = max(0, min(overlap, tile_height // 4))
+    strips = []
+    top = 0
+    while True:
+        if height - top <= tile_height * 5 // 4:
+            strips.append((top, height))
+            return strips
+        bottom = _nearest_gap(gaps, top + tile_height, top + tile_height * 3 // 4, top + tile_height)
+        strips.append((top, bottom))
+        # следующая полоса начинается чуть выше, чтобы строки на стыке попали целиком
+        nxt = bottom - overlap
+        new_top = _nearest_gap(gaps, nxt, nxt - overlap // 2, bottom)
+        if new_top <= top:
+            # защита от бесконечного цикла; не assert — он исчезает под python -O
+            raise RuntimeError("split_into_strips: полоса не продвинулась")
+        top = new_top
+
+
+def is_complete_table(text: str) -> bool:
+    """Таблица, пригодная для кэша last-good: начинается с '|' и без пометки о неполном результате."""
+    return text.strip().startswith("|") and PARTIAL_NOTE not in text
+
+
+def _split_table(table: str) -> tuple[list[str], list[str]]:
+    """Markdown-таблица -> (шапка вместе с разделителем, строки данных)."""
+    lines = table.splitlines()
+    for i, ln in enumerate(lines):
+        if SEPARATOR_RE.match(ln.strip()):
+            return lines[:i + 1], lines[i + 1:]
+    return [], lines
+
+
+def _row_key(line: str) -> tuple[str, ...]:
+    return tuple(c.strip().lower() for c in line.strip().strip("|").split("|"))
+
+
+def _overlap_len(prev: list[tuple[str, ...]], cur: list[tuple[str, ...]]) -> int:
+    """Длина самого длинного совпадения «хвост prev == начало cur» — это строки из зоны перекрытия."""
+    for k in range(min(len(prev), len(cur)), 0, -1):
+        if prev[-k:] == cur[:k]:
+            return k
+    return 0
+
+
+def merge_strip_tables(tables: list[str]) -> str:
+    """
+    Склеивает таблицы полос по порядку. Выкидываются только строки перекрытия:
+    начало полосы, совпадающее с концом предыдущей. Одинаковые строки в других
+    местах (повторы «—», один показатель в разное время) сохраняются.
+    """
+    header: list[str] = []
+    rows: list[str] = []
+    prev_keys: list[tuple[str, ...]] = []
+    for table in tables:
+        head, body = _split_table(table)
+        if head and not header:
+            header = head
+        keys = [_row_key(ln) for ln in body]
+        rows.extend(body[_overlap_len(prev_keys, keys):])
+        prev_keys = keys
+    if not rows:
+        return ""
+    return "\n".join(header + rows)
+
+
+def analyze_calendar_image_tiled(
+    png_path: Path,
+    api_key: str,
+    model: str = "gpt-4o-mini",
+    tile_height: int = TILE_HEIGHT,
+    overlap: int = TILE_OVERLAP,
+    workers: int = TILE_WORKERS,
+    mode: str = "markdown",
+) -> str:
+    """
+    Для высоких скринов: режем на перекрывающиеся полосы по границам строк,
+    извлекаем параллельно и склеиваем без дублей. Короткие — как обычно одним запросом.
+    """
+    if not api_key:
+        return "ℹ️ Анализ отключён: OPENAI_API_KEY не задан."
+
+    try:
+        from PIL import Image
+    except ImportError:
+        # Pillow не установлен — работаем по-старому
+        return analyze_calendar_image_openai(png_path, api_key, model, mode)
+
+    try:
+        with Image.open(png_path) as im:
+            img = im.convert("RGB")
+        if img.height <= tile_height * 5 // 4:
+            return analyze_calendar_image_openai(png_path, api_key, model, mode)
+
+        strips = split_into_strips(img.height, _gap_rows(img.convert("L")), tile_height, overlap)
+        blobs = []
+        for top, bottom in strips:
+            buf = io.BytesIO()
+            img.crop((0, top, img.width, bottom)).save(buf, format="PNG")
+            blobs.append(buf.getvalue())
+
+        from openai import OpenAI
+        client = OpenAI(api_key=api_key)
+        errors: list[Exception] = []
 
-        content = (resp.choices[0].message.content or "").strip()
+        def extract_strip(blob: bytes) -> str:
+            # ошибка одной полосы не должна терять остальные
+            try:
+                return _extract(client, blob, model, mode, tile=True)
+            except Exception as e:
+                errors.append(e)
+                return ""
 
-        if "Нет распознаваемых показателей" in content:
-            return "Нет распознаваемых показателей на скриншоте."
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            tables = list(pool.map(extract_strip, blobs))
+        if len(errors) == len(blobs):
+            raise errors[0]
 
-        # Вырезаем только блок таблицы
-        lines = [ln for ln in content.splitlines() if ln.strip()]
-        table_lines = [ln for ln in lines if ln.strip().startswith("|")]
-        if table_lines:
-            return "\n".join(table_lines)
-        return "Нет распознаваемых показателей на скриншоте."
+        merged = merge_strip_tables(tables)
+        if merged and errors:
+            merged += f"\n\n{PARTIAL_NOTE} {len(errors)} из {len(blobs)} полос не распознаны: {errors[0]}"
+        return merged or NO_ROWS
     except Exception as e:
         return f"⚠️ Ошибка анализа: {e}"
@@ -0,0 +1,117 @@
+# artifact_store.py
+import gzip
+import hashlib
+import os
+import time
+from pathlib import Path
+
+# Лимиты хранения (env читаем здесь, а не в settings: модуль используется и из
+# подпроцесса screenshot_page.py, где BOT_TOKEN/CAL_URLS не заданы)
+MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_BYTES", str(200 * 1024 * 1024)))  # 200 МБ
+MAX_AGE_SEC = int(os.environ.get("ARTIFACT_MAX_AGE_SEC", str(3 * 24 * 3600)))   # 3 дня
+
+# лимит на снятие одного дампа (HTML или PNG) при ошибке, сек;
+# бот учитывает его в запасе таймаута подпроцесса
+DUMP_TIMEOUT = 10
+
+# Текстовые дампы хорошо жмутся — храним их в gzip
+COMPRESS_SUFFIXES = {".html", ".log", ".txt"}
+
+
+class ArtifactStore:
+    """
+    Контентно-адресуемое хранилище debug-артефактов.
+      - имя файла = sha256 содержимого -> одинаковые дампы не дублируются
+      - HTML/логи хранятся сжатыми (.gz)
+      - retention: удаляем старше max_age_sec и самые старые сверх max_bytes
+    """
+
+    def __init__(self, root: Path, max_bytes: int = MAX_BYTES, max_age_sec: int = MAX_AGE_SEC):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+
+    def _path_for(self, digest: str, suffix: str) -> Path:
+        name = digest + suffix
+        if suffix in COMPRESS_SUFFIXES:
+            name += ".gz"
+        return self.root / digest[:2] / name
+
+    def put(self, data: bytes, suffix: str) -> Path:
+        """Сохраняет байты, возвращает путь. Повторный put того же содержимого только обновляет mtime."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path_for(digest, suffix)
+        if path.exists():
+            os.utime(path)
+            return path
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = gzip.compress(data, mtime=0) if path.suffix == ".gz" else data
+        # пишем через tmp + rename, чтобы параллельные процессы не видели недописанный файл
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+        self.enforce_retention()
+        return path
+
+    def put_text(self, text: str, suffix: str) -> Path:
+        return self.put(text.encode("utf-8", errors="ignore"), suffix)
+
+    @staticmethod
+    def read_bytes(path: Path) -> bytes:
+        """Читает артефакт, прозрачно распаковывая .gz."""
+        path = Path(path)
+        data = path.read_bytes()
+        return gzip.decompress(data) if path.suffix == ".gz" else data
+
+    @staticmethod
+    def display_name(path: Path) -> str:
+        """Имя для отправки пользователю (без .gz)."""
+        path = Path(path)
+        return path.stem if path.suffix == ".gz" else path.name
+
+    def _files(self) -> list[tuple[Path, os.stat_result]]:
+        if not self.root.exists():
+            return []
+        out = []
+        for p in self.root.glob("*/*"):
+            if p.name.startswith("."):
+                continue
+            try:
+                out.append((p, p.stat()))
+            except FileNotFoundError:
+                pass
+        return out
+
+    def enforce_retention(self) -> int:
+        """Удаляет устаревшие и лишние файлы. Возвращает число удалённых."""
+        now = time.time()
+        files = sorted(self._files(), key=lambda it: it[1].st_mtime)
+        total = sum(st.st_size for _, st in files)
+        removed = 0
+        for p, st in files:
+            too_old = self.max_age_sec > 0 and now - st.st_mtime > self.max_age_sec
+            too_big = self.max_bytes > 0 and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            try:
+                p.unlink()
+                removed += 1
+                total -= st.st_size
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self) -> dict:
+        files = self._files()
+        mtimes = [st.st_mtime for _, st in files]
+        return {
+            "root": str(self.root),
+            "files": len(files),
+            "bytes": sum(st.st_size for _, st in files),
+            "max_bytes": self.max_bytes,
+            "max_age_sec": self.max_age_sec,
+            "oldest": min(mtimes) if mtimes else None,
+            "newest": max(mtimes) if mtimes else None,
+        }
@@ -0,0 +1,55 @@
+# boot_profile.py
+import importlib
+import os
+import sys
+import time
+
+# Импортировать первым в main.py: отметки считаются от старта процесса
+_T0 = time.perf_counter()
+MARKS: list[tuple[str, float]] = []
+IMPORTS: dict[str, float] = {}
+
+
+def _process_age_ms() -> float:
+    """Сколько мс процесс прожил до импорта этого модуля (интерпретатор + uvicorn). Только Linux."""
+    try:
+        with open("/proc/self/stat") as f:
+            # поле 22 — starttime в тиках с загрузки системы (имя процесса в скобках может содержать пробелы)
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000)
+    except Exception:
+        return 0.0
+
+
+_BEFORE_MS = _process_age_ms()
+
+
+def _now_ms() -> float:
+    return _BEFORE_MS + (time.perf_counter() - _T0) * 1000
+
+
+def mark(label: str):
+    """Отметка этапа старта (мс от старта процесса)."""
+    ms = _now_ms()
+    MARKS.append((label, ms))
+    print(f"[boot] {ms:8.1f} ms  {label}", flush=True)
+
+
+def timed_import(name: str):
+    """importlib.import_module с замером (первый импорт — реальная стоимость, дальше из sys.modules)."""
+    t0 = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORTS.setdefault(name, (time.perf_counter() - t0) * 1000)
+    return module
+
+
+def report() -> dict:
+    return {
+        "process_before_main_ms": round(_BEFORE_MS, 1),
+        "uptime_ms": round(_now_ms(), 1),
+        "marks": [{"label": label, "ms": round(ms, 1)} for label, ms in MARKS],
+        "imports_ms": {name: round(ms, 1) for name, ms in IMPORTS.items()},
+        "modules_loaded": len(sys.modules),
+    }
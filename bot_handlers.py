@@ -2,8 +2,10 @@
 from __future__ import annotations
 
 import sys
+import time
 import datetime as dt
 import asyncio
+import hashlib
 from html import escape
 from pathlib import Path
 from re import search
@@ -16,11 +18,44 @@ from idempotency import chat_lock
 from screenshot_service import (
     build_scraper_cmd,
     run_scraper,
-    capture_page,
     sleep_ms,
 )
-from ai_analysis import analyze_calendar_image_openai
+from ai_analysis import (
+    analyze_calendar_image_openai,
+    analyze_calendar_image_tiled,
+    extraction_stats,
+    is_complete_table,
+)
 from utils_telegram import send_table_or_text
+from artifact_store import ArtifactStore, DUMP_TIMEOUT
+from tg_file_cache import FileIdCache
+from source_health import SourceHealth
+from capture_queue import CaptureQueue
+
+
+artifacts = ArtifactStore(settings.ARTIFACT_DIR)
+file_ids = FileIdCache(settings.FILE_ID_CACHE, settings.FILE_ID_CACHE_MAX)
+health = SourceHealth(
+    settings.SOURCE_HEALTH,
+    settings.LAST_GOOD_DIR,
+    max_timeout=settings.RUN_TIMEOUT,
+    min_timeout=settings.MIN_TIMEOUT,
+    margin=settings.TIMEOUT_MARGIN,
+    fail_threshold=settings.CB_FAIL_THRESHOLD,
+    cooldown_sec=settings.CB_COOLDOWN_SEC,
+)
+
+# в режиме queue захват выполняют capture_worker.py, бот только ставит задания
+capture_queue = CaptureQueue(settings.CAPTURE_QUEUE) if settings.CAPTURE_MODE == "queue" else None
+
+# запас подпроцесса сверх лимита самого скрипта: после --timeout скрипт ещё снимает
+# два дампа (HTML + PNG, по DUMP_TIMEOUT) и закрывает браузер; плюс старт python/chromium
+STARTUP_SLACK = 15
+SCRIPT_SLACK = 2 * DUMP_TIMEOUT + STARTUP_SLACK
+
+# строки, которые screenshot_page.py печатает при сохранении дампов
+DUMP_HTML_RE = r"\[dump(?:-on-error)?\] html -> (.+?\.html(?:\.gz)?)"
+DUMP_PNG_RE = r"\[dump(?:-on-error)?\] png -> (.+?\.png)"
 
 
 # ---------- Базовые команды ----------
@@ -30,7 +65,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Привет! Я умею:\n"
         "• /calendar — сделать скрин первой страницы из списка (CAL_URLS), извлечь таблицу показателей и прислать\n"
         "• /batch — собрать таблицы со ВСЕХ страниц из CAL_URLS одним сообщением\n"
-        "Дополнительно доступны /btc /eth /avax /help"
+        "Дополнительно доступны /btc /eth /avax /stats /help"
     )
 
 
@@ -39,10 +74,54 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Команды:\n"
         "• /calendar — скрин + извлечение таблицы (Actual / Forecast / Previous)\n"
         "• /batch — пройтись по всем URL из CAL_URLS и вернуть все таблицы одним сообщением\n"
+        "• /stats — debug-дампы, кэш загрузок, токены/задержка извлечения\n"
         "• /btc /eth /avax — тестовые команды\n"
     )
 
 
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    artifacts.enforce_retention()
+    st = artifacts.stats()
+    newest = dt.datetime.fromtimestamp(st["newest"]).strftime("%Y-%m-%d %H:%M") if st["newest"] else "—"
+    await update.message.reply_text(
+        "Debug-дампы:\n"
+        f"• каталог: {st['root']}\n"
+        f"• файлов: {st['files']}\n"
+        f"• занято: {st['bytes'] / 1024 / 1024:.1f} / {st['max_bytes'] / 1024 / 1024:.0f} МБ\n"
+        f"• хранение: {st['max_age_sec'] // 3600} ч\n"
+        f"• последний: {newest}"
+    )
+    fc = file_ids.stats()
+    avg_up = f"{fc['avg_upload_ms']:.0f} мс" if fc["avg_upload_ms"] is not None else "—"
+    avg_ref = f"{fc['avg_ref_ms']:.0f} мс" if fc["avg_ref_ms"] is not None else "—"
+    await update.message.reply_text(
+        "Кэш file_id:\n"
+        f"• записей: {fc['entries']} / {fc['max_items']}\n"
+        f"• попаданий: {fc['hits']}, загрузок: {fc['misses']}\n"
+        f"• сэкономлено: {fc['bytes_saved'] / 1024 / 1024:.1f} МБ (загружено {fc['bytes_uploaded'] / 1024 / 1024:.1f} МБ)\n"
+        f"• среднее время: загрузка {avg_up}, по ссылке {avg_ref}"
+    )
+    ex = extraction_stats()
+    lines = [f"Извлечение (текущий режим: {settings.EXTRACTION_MODE}):"]
+    for (mode, tile), m in ex.items():
+        kind = "полосы" if tile else "целый скрин"
+        lines.append(
+            f"• {mode}, {kind}: {m['calls']} вызовов, {m['avg_latency_ms']:.0f} мс, "
+            f"токены {m['avg_prompt_tokens']:.0f} вх / {m['avg_completion_tokens']:.0f} вых"
+        )
+    if not ex:
+        lines.append("• вызовов пока не было")
+    await update.message.reply_text("\n".join(lines))
+    src = health.stats()
+    if src:
+        lines = ["Источники:"]
+        for url, h in src.items():
+            state = "⛔ пропускается" if h["open"] else "✅"
+            timeout = f"{h['timeout']} с" if h["timeout"] else "по умолчанию"
+            lines.append(f"• {state} {url}\n  таймаут {timeout}, замеров {h['samples']}, ошибок подряд {h['streak']}")
+        await update.message.reply_text("\n".join(lines), disable_web_page_preview=True)
+
+
 async def btc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("BTC: 🟠")
 
@@ -55,6 +134,143 @@ async def avax(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("AVAX: 🔺")
 
 
+# ---------- Debug-дампы ----------
+
+async def send_debug_dumps(
+    chat_id: int,
+    context: ContextTypes.DEFAULT_TYPE,
+    tail: str,
+    html_filename: str | None = None,
+    png_caption: str = "debug screenshot",
+):
+    """Отправляет дампы, пути к которым screenshot_page.py напечатал в лог."""
+    html_match = search(DUMP_HTML_RE, tail)
+    png_match = search(DUMP_PNG_RE, tail)
+    try:
+        if html_match:
+            hp = Path(html_match.group(1))
+            if hp.exists():
+                await file_ids.send_document(
+                    context.bot, chat_id, artifacts.read_bytes(hp),
+                    filename=html_filename or artifacts.display_name(hp),
+                )
+        if png_match:
+            pp = Path(png_match.group(1))
+            if pp.exists():
+                await file_ids.send_photo(context.bot, chat_id, pp.read_bytes(), caption=png_caption)
+    except Exception:
+        pass
+
+
+# ---------- Захват с учётом здоровья источника ----------
+
+async def run_capture(
+    url: str,
+    out_png: Path,
+    log_path: Path,
+    user_data_dir: Path | None = None,
+    use_adaptive: bool = True,
+):
+    """
+    Запускает скринер (локально или через очередь воркеров) с адаптивным таймаутом
+    источника и обновляет его статистику.
+    user_data_dir — профиль Chromium (по умолчанию общий settings.USER_DATA_DIR).
+    use_adaptive=False — таймаут по умолчанию (RUN_TIMEOUT), без учёта истории.
+    Исключения (в т.ч. TimeoutExpired) пробрасываются — как у run_scraper.
+    """
+    script_timeout, run_timeout = health.capture_limits(url, SCRIPT_SLACK, use_adaptive)
+
+    cmd = build_scraper_cmd(
+        python_exec=sys.executable,
+        scraper=settings.SCRAPER,
+        url=url,
+        out_png=out_png,
+        user_data_dir=user_data_dir or settings.USER_DATA_DIR,
+        wait_for=settings.WAIT_FOR,
+        sleep_ms=settings.SLEEP_MS,
+        artifact_dir=settings.ARTIFACT_DIR,
+        debug_dumps=settings.DEBUG_DUMPS,
+        global_timeout=script_timeout,
+    )
+
+    def _run():
+        if capture_queue is not None:
+            return capture_queue.run(cmd, run_timeout, log_path, settings.CAPTURE_QUEUE_WAIT)
+        t0 = time.monotonic()
+        proc = run_scraper(cmd, run_timeout, log_path)
+        return proc, time.monotonic() - t0
+
+    loop = asyncio.get_running_loop()
+    try:
+        proc, elapsed = await loop.run_in_executor(None, _run)
+    except Exception:
+        health.record_failure(url)
+        raise
+
+    if proc.returncode == 0 and out_png.exists():
+        health.record_success(url, elapsed, out_png)
+    else:
+        health.record_failure(url)
+    return proc
+
+
+async def probe_source(url: str):
+    """Фоновая проверка источника с открытым circuit; удачный захват его закрывает."""
+    health.probe_started(url)
+    try:
+        key = hashlib.sha1(url.encode()).hexdigest()[:10]
+        probe_dir = Path("/var/data/batch")
+        # свой профиль: probe идёт в фоне параллельно с /batch, а один профиль
+        # Chromium нельзя открыть из двух браузеров.
+        # Таймаут — по умолчанию: история хранит только удачные замеры, и для
+        # замедлившегося источника адаптивный лимит никогда не дал бы probe пройти
+        await run_capture(
+            url, probe_dir / f"probe_{key}.png", probe_dir / f"probe_{key}.log",
+            user_data_dir=Path(f"{settings.USER_DATA_DIR}-probe-{key}"),
+            use_adaptive=False,
+        )
+    except Exception:
+        pass
+    finally:
+        health.probe_finished(url)
+
+
+# ссылки на фоновые probe-задачи, чтобы их не собрал GC посреди работы
+_probe_tasks: set[asyncio.Task] = set()
+
+
+def _probe_done(task: asyncio.Task):
+    _probe_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[source-health] probe failed: {task.exception()!r}", flush=True)
+
+
+def maybe_probe(url: str):
+    if health.should_probe(url):
+        task = asyncio.create_task(probe_source(url))
+        _probe_tasks.add(task)
+        task.add_done_callback(_probe_done)
+
+
+def _cached_note(url: str) -> tuple[dict, str]:
+    good = health.last_good(url)
+    when = dt.datetime.fromtimestamp(good["ts"]).strftime("%Y-%m-%d %H:%M") if good["ts"] else None
+    return good, when
+
+
+# ---------- Извлечение таблицы ----------
+
+def analyze_png(png_path: Path) -> str:
+    """Извлечение таблицы: тайлинг для высоких скринов (CAL_TILED=1) или один запрос."""
+    if settings.TILED_EXTRACTION:
+        return analyze_calendar_image_tiled(
+            png_path, settings.OPENAI_API_KEY,
+            tile_height=settings.TILE_HEIGHT, overlap=settings.TILE_OVERLAP,
+            mode=settings.EXTRACTION_MODE,
+        )
+    return analyze_calendar_image_openai(png_path, settings.OPENAI_API_KEY, mode=settings.EXTRACTION_MODE)
+
+
 # ---------- Одна страница: скрин + извлечение ----------
 
 async def calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -76,18 +292,25 @@ async def calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception:
             pass
 
-        await update.message.reply_text(f"🧑‍💻 Делаю скрин:\n{url}")
+        # источник стабильно падает — не ждём таймаут, отдаём последний удачный результат
+        if health.is_open(url):
+            maybe_probe(url)
+            good, when = _cached_note(url)
+            if not (good["png"] or good["table"]):
+                await update.message.reply_text(
+                    f"⛔ Источник временно недоступен (несколько ошибок подряд), кэша нет:\n{url}"
+                )
+                return
+            await update.message.reply_text(
+                f"⛔ Источник временно недоступен — показываю последний удачный результат от {when}:\n{url}"
+            )
+            if good["png"]:
+                await file_ids.send_photo(context.bot, chat_id, good["png"].read_bytes(), caption=f"Кэш от {when}")
+            if good["table"]:
+                await send_table_or_text(chat_id, context, good["table"])
+            return
 
-        # Команда для скриншота
-        cmd = build_scraper_cmd(
-            python_exec=sys.executable,
-            scraper=settings.SCRAPER,
-            url=url,
-            out_png=settings.OUT_PNG,
-            user_data_dir=settings.USER_DATA_DIR,
-            wait_for=settings.WAIT_FOR,
-            sleep_ms=settings.SLEEP_MS,
-        )
+        await update.message.reply_text(f"🧑‍💻 Делаю скрин:\n{url}")
 
         loop = asyncio.get_running_loop()
 
@@ -96,9 +319,7 @@ async def calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         log_path.parent.mkdir(parents=True, exist_ok=True)
 
         try:
-            proc = await loop.run_in_executor(
-                None, lambda: run_scraper(cmd, settings.RUN_TIMEOUT, log_path)
-            )
+            proc = await run_capture(url, settings.OUT_PNG, log_path)
         except Exception as e:
             await update.message.reply_text(f"⚠️ Ошибка запуска: {e}")
             return
@@ -111,28 +332,12 @@ async def calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception:
                 pass
 
-            # попытаемся выдернуть пути к debug-дампам, которые пишет screenshot_page.py
-            html_match = search(r"\[dump(?:-on-error)?\] html -> (.+?\.html)", tail)
-            png_match1 = search(r"\[ok\] saved debug screenshot -> (.+?\.png)", tail)
-            png_match2 = search(r"\[dump-on-error\] html=.+, png=(.+?\.png)", tail)
-            png_path_str = png_match1.group(1) if png_match1 else (png_match2.group(1) if png_match2 else None)
-
             await update.message.reply_text(
                 f"❌ Ошибка скринера (код {proc.returncode}).\n<pre>{escape(tail[-1800:])}</pre>",
                 parse_mode="HTML",
             )
             # отправим дампы, если существуют
-            try:
-                if html_match:
-                    hp = Path(html_match.group(1))
-                    if hp.exists():
-                        await context.bot.send_document(chat_id=chat_id, document=hp.open("rb"), filename=hp.name)
-                if png_path_str:
-                    pp = Path(png_path_str)
-                    if pp.exists():
-                        await context.bot.send_photo(chat_id=chat_id, photo=pp.open("rb"), caption="debug screenshot")
-            except Exception:
-                pass
+            await send_debug_dumps(chat_id, context, tail)
             return
 
         if not settings.OUT_PNG.exists():
@@ -143,15 +348,16 @@ async def calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # 1) отправляем фото
         caption = f"Экономический календарь • {dt.datetime.now():%Y-%m-%d %H:%M}"
-        with settings.OUT_PNG.open("rb") as f:
-            await context.bot.send_photo(chat_id=chat_id, photo=f, caption=caption)
+        await file_ids.send_photo(context.bot, chat_id, settings.OUT_PNG.read_bytes(), caption=caption)
 
         # 2) извлекаем таблицу через OpenAI (если ключ задан)
         if settings.OPENAI_API_KEY:
             await context.bot.send_chat_action(chat_id=chat_id, action="typing")
             table = await loop.run_in_executor(
-                None, lambda: analyze_calendar_image_openai(settings.OUT_PNG, settings.OPENAI_API_KEY)
+                None, lambda: analyze_png(settings.OUT_PNG)
             )
+            if is_complete_table(table):
+                health.remember_table(url, table)
             await send_table_or_text(chat_id, context, table)
         else:
             await context.bot.send_message(
@@ -191,16 +397,26 @@ async def batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
             out_png = save_dir / f"page_{idx:02d}.png"
             log_path = save_dir / f"scraper_{idx:02d}.log"
 
+            # 0) источник с открытым circuit — сразу берём последний удачный результат
+            if health.is_open(url):
+                maybe_probe(url)
+                good, when = _cached_note(url)
+                if good["table"]:
+                    header = f"| Источник {idx}: {url} (недоступен, кэш от {when}) |\n|---|"
+                    table = good["table"]
+                else:
+                    header = f"| Источник {idx}: {url} |\n|---|"
+                    table = (
+                        "| Показатель | Факт | Прогноз | Предыдущий |\n"
+                        "|---|---:|---:|---:|\n"
+                        "| Источник временно недоступен, кэша нет |  |  |  |"
+                    )
+                parts.append(header + "\n" + table)
+                continue
+
             # 1) захват
             try:
-                proc = await loop.run_in_executor(
-                    None,
-                    lambda: capture_page(
-                        sys.executable, settings.SCRAPER, url, out_png,
-                        settings.USER_DATA_DIR, settings.WAIT_FOR, settings.SLEEP_MS,
-                        settings.RUN_TIMEOUT, log_path
-                    ),
-                )
+                proc = await run_capture(url, out_png, log_path)
                 ok = proc.returncode == 0 and out_png.exists()
             except Exception:
                 ok = False
@@ -213,12 +429,6 @@ async def batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 except Exception:
                     pass
 
-                # попробуем вытащить пути к дампам
-                html_match = search(r"\[dump(?:-on-error)?\] html -> (.+?\.html)", tail)
-                png_match1 = search(r"\[ok\] saved debug screenshot -> (.+?\.png)", tail)
-                png_match2 = search(r"\[dump-on-error\] html=.+, png=(.+?\.png)", tail)
-                png_path_str = png_match1.group(1) if png_match1 else (png_match2.group(1) if png_match2 else None)
-
                 header = f"| Источник {idx}: {url} |\n|---|"
                 table = (
                     "| Показатель | Факт | Прогноз | Предыдущий |\n"
@@ -228,25 +438,20 @@ async def batch(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parts.append(header + "\n" + table)
 
                 # отправим артефакты этой итерации (если есть)
-                try:
-                    if html_match:
-                        hp = Path(html_match.group(1))
-                        if hp.exists():
-                            await context.bot.send_document(chat_id=chat_id, document=hp.open("rb"), filename=f"debug_{idx}.html")
-                    if png_path_str:
-                        pp = Path(png_path_str)
-                        if pp.exists():
-                            await context.bot.send_photo(chat_id=chat_id, photo=pp.open("rb"), caption=f"debug screenshot {idx}")
-                except Exception:
-                    pass
+                await send_debug_dumps(
+                    chat_id, context, tail,
+                    html_filename=f"debug_{idx}.html", png_caption=f"debug screenshot {idx}",
+                )
 
                 sleep_ms(settings.BATCH_SLEEP_MS)
                 continue
 
             # 2) извлечение
             table = await loop.run_in_executor(
-                None, lambda: analyze_calendar_image_openai(out_png, settings.OPENAI_API_KEY)
+                None, lambda: analyze_png(out_png)
             )
+            if is_complete_table(table):
+                health.remember_table(url, table)
             if not table.strip().startswith("|"):
                 table = (
                     "| Показатель | Факт | Прогноз | Предыдущий |\n"
@@ -270,5 +475,6 @@ def register_handlers(app):
     app.add_handler(CommandHandler("btc", btc))
     app.add_handler(CommandHandler("eth", eth))
     app.add_handler(CommandHandler("avax", avax))
+    app.add_handler(CommandHandler("stats", stats))
     app.add_handler(CommandHandler("calendar", calendar))
     app.add_handler(CommandHandler("batch", batch))
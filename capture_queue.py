@@ -0,0 +1,176 @@
+# capture_queue.py
+import json
+import sqlite3
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+HEARTBEAT_SEC = 10      # как часто воркер подтверждает, что задание ещё выполняется
+LEASE_SLACK = 60        # сек без heartbeat, после которых задание считается брошенным и отдаётся другому воркеру
+MAX_ATTEMPTS = 2        # сколько раз задание можно взять (после падения воркера)
+POLL_SEC = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    argv        TEXT    NOT NULL,
+    timeout     INTEGER NOT NULL,
+    log_path    TEXT    NOT NULL,
+    status      TEXT    NOT NULL DEFAULT 'queued',   -- queued | running | done | failed | cancelled
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    returncode  INTEGER,
+    error       TEXT,
+    worker      TEXT,
+    created_at  REAL    NOT NULL,
+    claimed_at  REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id);
+"""
+
+
+class CaptureQueue:
+    """
+    Долговечная очередь заданий на захват в SQLite.
+    Бот кладёт аргументы screenshot_page.py (без python/пути к скрипту), воркеры
+    (capture_worker.py) забирают задания и пишут результат. Файл очереди, лог и PNG
+    должны лежать на общем томе (/var/data), тогда воркеров может быть сколько угодно —
+    в разных процессах и на разных машинах.
+
+    Требования к общему тому для нескольких машин:
+      - рабочие POSIX-блокировки (fcntl) — на них держится BEGIN IMMEDIATE в claim();
+        SQLite документирует, что на многих сетевых ФС (NFS без lockd, SMB, часть
+        облачных томов) они ненадёжны — тогда воркеры держите на одной машине с локальным диском;
+      - журнал — обычный rollback, не WAL: WAL через сетевые ФС не работает;
+      - синхронизированные часы (NTP): брошенное задание определяется по heartbeat_at,
+        записанному часами воркера, а проверяется часами другой машины; расхождение
+        должно быть заметно меньше LEASE_SLACK - HEARTBEAT_SEC.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            # очереди, созданные до появления heartbeat_at
+            cols = {r["name"] for r in db.execute("PRAGMA table_info(jobs)")}
+            if "heartbeat_at" not in cols:
+                db.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    @contextmanager
+    def _connect(self):
+        # autocommit: каждая запись — отдельная короткая транзакция
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # --- сторона бота ---
+
+    def enqueue(self, argv: list[str], timeout_sec: int, log_file: Path) -> int:
+        with self._connect() as db:
+            cur = db.execute(
+                "INSERT INTO jobs (argv, timeout, log_path, created_at) VALUES (?, ?, ?, ?)",
+                (json.dumps(argv), timeout_sec, str(log_file), time.time()),
+            )
+            return cur.lastrowid
+
+    def get(self, job_id: int) -> sqlite3.Row | None:
+        with self._connect() as db:
+            return db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def cancel_if_queued(self, job_id: int) -> bool:
+        with self._connect() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            return cur.rowcount > 0
+
+    def run(
+        self, cmd: list[str], timeout_sec: int, log_file: Path, queue_wait_sec: int
+    ) -> tuple[subprocess.CompletedProcess[str], float]:
+        """
+        Аналог run_scraper через очередь: cmd — команда из build_scraper_cmd.
+        Ждёт результат не дольше timeout_sec + queue_wait_sec, иначе TimeoutExpired.
+        Возвращает (результат, время работы воркера в сек — без ожидания в очереди).
+        """
+        job_id = self.enqueue(cmd[2:], timeout_sec, log_file)
+        deadline = time.monotonic() + timeout_sec + queue_wait_sec
+        while time.monotonic() < deadline:
+            row = self.get(job_id)
+            if row is not None and row["status"] in ("done", "failed"):
+                if row["returncode"] is None:
+                    if row["error"] == "timeout":
+                        raise subprocess.TimeoutExpired(cmd, timeout_sec)
+                    raise RuntimeError(f"capture worker: {row['error']}")
+                elapsed = (row["finished_at"] or 0) - (row["claimed_at"] or 0)
+                return subprocess.CompletedProcess(cmd, row["returncode"]), max(0.0, elapsed)
+            time.sleep(POLL_SEC)
+
+        self.cancel_if_queued(job_id)
+        raise subprocess.TimeoutExpired(cmd, timeout_sec + queue_wait_sec)
+
+    # --- сторона воркера ---
+
+    def claim(self, worker: str) -> sqlite3.Row | None:
+        """
+        Атомарно берёт самое старое задание. Задания, по которым heartbeat не приходил
+        дольше LEASE_SLACK (воркер упал), возвращаются в очередь или, после
+        MAX_ATTEMPTS попыток, помечаются failed.
+        """
+        now = time.time()
+        with self._connect() as db:
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                    "error = CASE WHEN attempts >= ? THEN 'lease expired' ELSE error END, "
+                    "finished_at = CASE WHEN attempts >= ? THEN ? ELSE finished_at END "
+                    "WHERE status = 'running' AND COALESCE(heartbeat_at, claimed_at) + ? < ?",
+                    (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, now, LEASE_SLACK, now),
+                )
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                        "claimed_at = ?, heartbeat_at = ? WHERE id = ?",
+                        (worker, now, now, row["id"]),
+                    )
+                db.execute("COMMIT")
+                return row
+            except Exception:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """Продлевает лизинг задания; False — задание уже не наше (отдано другому воркеру/снято)."""
+        with self._connect() as db:
+            cur = db.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                (time.time(), job_id, worker),
+            )
+            return cur.rowcount > 0
+
+    def complete(self, job_id: int, returncode: int | None, error: str | None = None):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, returncode = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("done" if returncode is not None else "failed", returncode, error, time.time(), job_id),
+            )
+
+    def purge(self, older_than_sec: int = 24 * 3600) -> int:
+        """Удаляет завершённые задания старше older_than_sec."""
+        with self._connect() as db:
+            cur = db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                (time.time() - older_than_sec,),
+            )
+            return cur.rowcount
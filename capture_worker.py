@@ -0,0 +1,109 @@
+# capture_worker.py
+# Opt-in: нужен только при CAPTURE_MODE=queue (по умолчанию бот снимает скрины сам).
+# Запуск: python capture_worker.py --procs N — на нескольких машинах только при общем
+# /var/data с рабочими POSIX-блокировками и синхронизированными часами (см. CaptureQueue).
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from capture_queue import CaptureQueue, HEARTBEAT_SEC
+from screenshot_service import run_scraper
+
+SCRAPER = Path(__file__).resolve().parent / "screenshot_page.py"
+DEFAULT_QUEUE = os.environ.get("CAPTURE_QUEUE", "/var/data/capture_queue.sqlite3")
+PURGE_EVERY_SEC = 3600
+
+
+def with_own_profile(argv: list[str], slot: str) -> list[str]:
+    """Один persistent-профиль Chromium нельзя открыть из двух браузеров — у каждого слота свой."""
+    argv = list(argv)
+    if "--user-data-dir" in argv:
+        i = argv.index("--user-data-dir") + 1
+        argv[i] = f"{argv[i]}-{slot}"
+    return argv
+
+
+def work(queue_path: Path, poll_ms: int, slot: int = 0):
+    """Цикл одного воркера: взять задание -> запустить screenshot_page.py -> записать результат."""
+    queue = CaptureQueue(queue_path)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    profile_slot = f"{socket.gethostname()}-{slot}"
+    print(f"[worker] {worker_id} started, queue={queue_path}", flush=True)
+    last_purge = 0.0
+
+    while True:
+        if time.time() - last_purge > PURGE_EVERY_SEC:
+            queue.purge()
+            last_purge = time.time()
+
+        job = queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_ms / 1000)
+            continue
+
+        # python и путь к скрипту — свои, остальные аргументы — из задания
+        cmd = [sys.executable, str(SCRAPER)] + with_own_profile(json.loads(job["argv"]), profile_slot)
+        print(f"[worker] job {job['id']} -> {' '.join(cmd[2:4])}", flush=True)
+
+        # heartbeat в фоне, пока идёт подпроцесс: без него задание сочтут брошенным
+        stop = threading.Event()
+
+        def beat(job_id=job["id"]):
+            while not stop.wait(HEARTBEAT_SEC):
+                try:
+                    queue.heartbeat(job_id, worker_id)
+                except Exception as e:
+                    print(f"[worker] job {job_id} heartbeat fail: {e}", flush=True)
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            proc = run_scraper(cmd, job["timeout"], Path(job["log_path"]))
+            queue.complete(job["id"], proc.returncode)
+            print(f"[worker] job {job['id']} rc={proc.returncode}", flush=True)
+        except subprocess.TimeoutExpired:
+            queue.complete(job["id"], None, "timeout")
+            print(f"[worker] job {job['id']} timeout", flush=True)
+        except Exception as e:
+            queue.complete(job["id"], None, str(e))
+            print(f"[worker] job {job['id']} fail: {e}", flush=True)
+        finally:
+            stop.set()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Capture-воркер: выполняет задания из очереди захвата")
+    ap.add_argument("--queue", default=DEFAULT_QUEUE, help="путь к SQLite-очереди (общий том)")
+    ap.add_argument("--procs", type=int, default=int(os.environ.get("CAPTURE_PROCS", "1")),
+                    help="сколько процессов-воркеров запустить")
+    ap.add_argument("--poll-ms", type=int, default=500)
+    args = ap.parse_args()
+
+    queue_path = Path(args.queue)
+    if args.procs <= 1:
+        work(queue_path, args.poll_ms)
+        return
+
+    procs = [
+        multiprocessing.Process(target=work, args=(queue_path, args.poll_ms, slot), daemon=True)
+        for slot in range(args.procs)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        # если один из воркеров умер — падаем целиком, пусть перезапустит супервизор
+        while all(p.is_alive() for p in procs):
+            time.sleep(1)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
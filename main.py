@@ -1,29 +1,95 @@
+import boot_profile  # первым: замеры старта считаются от него
 import asyncio
 from fastapi import FastAPI, Request, HTTPException
-from telegram import Update
-from telegram.ext import ApplicationBuilder
 from settings import settings
 from idempotency import remember_update
-from bot_handlers import register_handlers
+
+boot_profile.mark("main: imports")
 
 app = FastAPI(title="TG Webhook • Macro Calendar")
-application = ApplicationBuilder().token(settings.BOT_TOKEN).build()
-register_handlers(application)
+_application = None
+_update_cls = None
+_boot_lock = asyncio.Lock()
+_warmup_task: asyncio.Task | None = None
+# задачи обработки апдейтов: ссылки держим, чтобы их не собрал GC
+_update_tasks: set[asyncio.Task] = set()
+
+
+def _build_application():
+    global _update_cls
+    tg_ext = boot_profile.timed_import("telegram.ext")
+    handlers = boot_profile.timed_import("bot_handlers")
+    _update_cls = boot_profile.timed_import("telegram").Update
+    application = tg_ext.ApplicationBuilder().token(settings.BOT_TOKEN).build()
+    handlers.register_handlers(application)
+    return application
+
+
+async def get_application():
+    """Ленивая сборка и инициализация telegram Application (один раз)."""
+    global _application
+    async with _boot_lock:
+        if _application is None:
+            # импорты тяжёлые и синхронные — в потоке, чтобы не блокировать приём вебхуков
+            application = await asyncio.to_thread(_build_application)
+            boot_profile.mark("application: built")
+            await application.initialize()
+            await application.start()
+            _application = application
+            boot_profile.mark("application: started")
+    return _application
+
+
+async def _process(data: dict):
+    application = await get_application()
+    update = _update_cls.de_json(data, application.bot)
+    await application.process_update(update)
+
+
+def _warmup_done(task: asyncio.Task):
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        # не фатально: первый вебхук повторит сборку в _process
+        print(f"[boot] warm-up failed: {exc!r}", flush=True)
+
+
+def _update_done(task: asyncio.Task):
+    _update_tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        # апдейт уже подтверждён Telegram — повтора не будет, оставляем след в логе
+        print(f"[webhook] update {task.get_name()} failed: {exc!r}", flush=True)
+
 
 @app.on_event("startup")
 async def startup():
-    await application.initialize()
-    await application.start()
+    global _warmup_task
+    boot_profile.mark("http: startup")
+    if settings.FAST_BOOT:
+        # прогрев в фоне (ссылку держим, чтобы задачу не собрал GC); первый вебхук дождётся его внутри _process
+        _warmup_task = asyncio.create_task(get_application())
+        _warmup_task.add_done_callback(_warmup_done)
+    else:
+        await get_application()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await application.stop()
-    await application.shutdown()
+    if _application is not None:
+        await _application.stop()
+        await _application.shutdown()
 
 @app.get("/")
 def healthcheck():
     return {"status": "ok"}
 
+@app.get("/startup")
+def startup_report():
+    return {"fast_boot": settings.FAST_BOOT, "ready": _application is not None, **boot_profile.report()}
+
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
     if settings.WEBHOOK_SECRET:
@@ -31,8 +97,10 @@ async def telegram_webhook(request: Request):
         if token != settings.WEBHOOK_SECRET:
             raise HTTPException(status_code=401, detail="bad secret token")
     data = await request.json()
-    update = Update.de_json(data, application.bot)
-    if not remember_update(update.update_id):
+    # дедуп по сырому update_id — без telegram.Update, чтобы ack не ждал загрузки бота
+    if not remember_update(data.get("update_id")):
         return {"ok": True}
-    asyncio.create_task(application.process_update(update))
+    task = asyncio.create_task(_process(data), name=str(data.get("update_id")))
+    _update_tasks.add(task)
+    task.add_done_callback(_update_done)
     return {"ok": True}
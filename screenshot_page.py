@@ -2,11 +2,12 @@
 import argparse
 import asyncio
 import sys
-from datetime import datetime
 from pathlib import Path
 
 from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 
+from artifact_store import ArtifactStore, DUMP_TIMEOUT
+
 # Таймауты и попытки
 NAV_TIMEOUT = 30_000     # навигация до DOMContentLoaded
 SEL_TIMEOUT = 15_000     # ожидание селекторов
@@ -78,7 +79,25 @@ async def goto_with_retries(page, url: str):
         raise last_err
 
 
-async def _core(args, out_path: Path, debug_html: Path, debug_png: Path):
+async def dump_debug(page, store: ArtifactStore, tag: str):
+    """Сохраняет HTML + PNG страницы в хранилище артефактов (только по требованию/при ошибке)."""
+    try:
+        html = await asyncio.wait_for(page.content(), timeout=DUMP_TIMEOUT)
+        hp = store.put_text(html, ".html")
+        print(f"[{tag}] html -> {hp}")
+    except Exception as e:
+        print(f"[{tag}] html fail: {e!r}")
+    try:
+        png = await asyncio.wait_for(
+            page.screenshot(full_page=True, timeout=DUMP_TIMEOUT * 1000), timeout=DUMP_TIMEOUT
+        )
+        pp = store.put(png, ".png")
+        print(f"[{tag}] png -> {pp}")
+    except Exception as e:
+        print(f"[{tag}] png fail: {e!r}")
+
+
+async def _core(args, out_path: Path, store: ArtifactStore):
     async with async_playwright() as pw:
         bt = pw.chromium
         launch_kwargs = dict(
@@ -156,44 +175,52 @@ async def _core(args, out_path: Path, debug_html: Path, debug_png: Path):
         })();
         """)
 
-        # Навигация
-        await goto_with_retries(page, args.url)
+        try:
+            # Навигация
+            await goto_with_retries(page, args.url)
 
-        # Куки/попапы
-        for sel in COOKIE_SELECTORS:
-            await maybe_click(page, sel, 4000)
-        for sel in POPUP_SELECTORS:
-            await maybe_click(page, sel, 1500)
+            # Куки/попапы
+            for sel in COOKIE_SELECTORS:
+                await maybe_click(page, sel, 4000)
+            for sel in POPUP_SELECTORS:
+                await maybe_click(page, sel, 1500)
 
-        # Пауза после загрузки
-        if args.sleep_ms > 0:
-            await asyncio.sleep(args.sleep_ms / 1000)
+            # Пауза после загрузки
+            if args.sleep_ms > 0:
+                await asyncio.sleep(args.sleep_ms / 1000)
 
-        # Если переданы свои селекторы — мягко подождём любой из них
-        for sel in (args.wait_for or []):
-            try:
-                await page.wait_for_selector(sel, timeout=SEL_TIMEOUT, state="visible")
-                print(f"[wait] visible: {sel}")
-                break
-            except PWTimeout:
-                continue
+            # Если переданы свои селекторы — мягко подождём любой из них
+            for sel in (args.wait_for or []):
+                try:
+                    await page.wait_for_selector(sel, timeout=SEL_TIMEOUT, state="visible")
+                    print(f"[wait] visible: {sel}")
+                    break
+                except PWTimeout:
+                    continue
 
-        # Сколлим, чтобы ленивые блоки подгрузились
-        await gentle_scroll(page)
+            # Сколлим, чтобы ленивые блоки подгрузились
+            await gentle_scroll(page)
 
-        # Сохранить HTML-дамп (для диагностики)
-        try:
-            html = await page.content()
-            debug_html.write_text(html, encoding="utf-8", errors="ignore")
-            print(f"[dump] html -> {debug_html}")
-        except Exception as e:
-            print(f"[dump] html fail: {e}")
+            # Скриншот рендерим один раз; debug-копию берём из тех же байт
+            png = await page.screenshot(path=str(out_path), full_page=True, timeout=20000)
+            print(f"[ok] saved screenshot -> {out_path}")
 
-        # Скриншоты (рабочий и debug)
-        await page.screenshot(path=str(out_path), full_page=True, timeout=20000)
-        await page.screenshot(path=str(debug_png), full_page=True, timeout=20000)
-        print(f"[ok] saved screenshot -> {out_path}")
-        print(f"[ok] saved debug screenshot -> {debug_png}")
+            # Дампы на успехе — только по запросу (--debug-dumps)
+            if args.debug_dumps:
+                try:
+                    html = await page.content()
+                    print(f"[dump] html -> {store.put_text(html, '.html')}")
+                except Exception as e:
+                    print(f"[dump] html fail: {e}")
+                try:
+                    print(f"[dump] png -> {store.put(png, '.png')}")
+                except Exception as e:
+                    # скрин уже снят — сбой хранилища дампов не должен валить захват
+                    print(f"[dump] png fail: {e}")
+        except BaseException:
+            # ошибка или global timeout (CancelledError) — снимаем дампы для диагностики
+            await dump_debug(page, store, "dump-on-error")
+            raise
 
         await context.close()
 
@@ -207,17 +234,20 @@ async def main():
     ap.add_argument("--user-data-dir", default=None)
     ap.add_argument("--wait-for", action="append", help="доп. CSS-селекторы (можно несколько)")
     ap.add_argument("--sleep-ms", type=int, default=1500)
+    ap.add_argument("--artifact-dir", default=None, help="куда класть debug-дампы (по умолчанию <out>/../artifacts)")
+    ap.add_argument("--debug-dumps", action="store_true", help="сохранять HTML/PNG-дампы и при успехе")
+    ap.add_argument("--timeout", type=int, default=GLOBAL_TIMEOUT, help="общий лимит работы (сек)")
     args = ap.parse_args()
 
     out_path = Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
+    if args.user_data_dir:
+        Path(args.user_data_dir).mkdir(parents=True, exist_ok=True)
 
-    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    debug_html = out_path.parent / f"debug_{stamp}.html"
-    debug_png  = out_path.parent / f"debug_{stamp}.png"
+    store = ArtifactStore(Path(args.artifact_dir) if args.artifact_dir else out_path.parent / "artifacts")
 
     try:
-        await asyncio.wait_for(_core(args, out_path, debug_html, debug_png), timeout=GLOBAL_TIMEOUT)
+        await asyncio.wait_for(_core(args, out_path, store), timeout=args.timeout)
     except asyncio.TimeoutError:
         print("[fatal] global timeout", file=sys.stderr)
         sys.exit(1)
@@ -13,12 +13,17 @@ def build_scraper_cmd(
     user_data_dir: Path,
     wait_for: Sequence[str] | None = None,
     sleep_ms: int = 0,
+    artifact_dir: Path | None = None,
+    debug_dumps: bool = False,
+    global_timeout: int | None = None,
 ) -> List[str]:
     """
     Собирает команду запуска screenshot_page.py.
     Поддерживает:
       - несколько --wait-for
       - опциональный --sleep-ms (мягкая пауза после load)
+      - --artifact-dir / --debug-dumps (куда и когда класть debug-дампы)
+      - опциональный --timeout (адаптивный лимит работы скрипта)
     """
     cmd = [
         python_exec,
@@ -32,6 +37,12 @@ def build_scraper_cmd(
             cmd += ["--wait-for", sel]
     if sleep_ms and sleep_ms > 0:
         cmd += ["--sleep-ms", str(sleep_ms)]
+    if artifact_dir:
+        cmd += ["--artifact-dir", str(artifact_dir)]
+    if debug_dumps:
+        cmd += ["--debug-dumps"]
+    if global_timeout:
+        cmd += ["--timeout", str(global_timeout)]
     return cmd
 
 
@@ -60,6 +71,9 @@ def capture_page(
     sleep_ms_val: int,
     timeout_sec: int,
     log_file: Path,
+    artifact_dir: Path | None = None,
+    debug_dumps: bool = False,
+    global_timeout: int | None = None,
 ) -> subprocess.CompletedProcess[str]:
     """Удобная обёртка: собрать команду и запустить."""
     cmd = build_scraper_cmd(
@@ -70,6 +84,9 @@ def capture_page(
         user_data_dir=user_data_dir,
         wait_for=wait_for,
         sleep_ms=sleep_ms_val,
+        artifact_dir=artifact_dir,
+        debug_dumps=debug_dumps,
+        global_timeout=global_timeout,
     )
     return run_scraper(cmd, timeout_sec, log_file)
 
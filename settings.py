@@ -14,12 +14,23 @@ class Settings:
         # ключ OpenAI для анализа скринов
         self.OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
+        # быстрый холодный старт: telegram и хендлеры грузятся в фоне после подъёма HTTP,
+        # вебхуки подтверждаются сразу и обрабатываются, когда бот готов
+        self.FAST_BOOT = os.environ.get("FAST_BOOT", "") == "1"
+
         # === ПУТИ ===
         self.APP_DIR = Path(__file__).resolve().parent
         self.SCRAPER = self.APP_DIR / "screenshot_page.py"
         self.OUT_PNG = self.APP_DIR / "page.png"
+        # каталог профиля создаёт сам screenshot_page.py — импорт settings без работы с ФС
         self.USER_DATA_DIR = Path("/var/data/user-data")
-        self.USER_DATA_DIR.mkdir(exist_ok=True)
+        # debug-дампы (HTML/PNG) — контентно-адресуемое хранилище с retention
+        self.ARTIFACT_DIR = Path(os.environ.get("ARTIFACT_DIR", "/var/data/artifacts"))
+        # сохранять дампы и на успешных прогонах (по умолчанию — только при ошибке)
+        self.DEBUG_DUMPS = os.environ.get("DEBUG_DUMPS", "") == "1"
+        # кэш Telegram file_id (повторные фото/документы шлём по ссылке)
+        self.FILE_ID_CACHE = Path(os.environ.get("FILE_ID_CACHE", "/var/data/tg_file_ids.json"))
+        self.FILE_ID_CACHE_MAX = int(os.environ.get("FILE_ID_CACHE_MAX", "500"))
 
         # === ССЫЛКИ ДЛЯ СКРИНОВ ===
         # Список страниц через запятую: CAL_URLS="https://a.com/x,https://b.com/y"
@@ -46,7 +57,48 @@ class Settings:
         # пауза между страницами (batch mode)
         self.BATCH_SLEEP_MS = int(os.environ.get("BATCH_SLEEP_MS", "250"))
 
+        # === ИЗВЛЕЧЕНИЕ ===
+        # режим ответа модели: markdown (таблица текстом) или json (компактная схема)
+        self.EXTRACTION_MODE = os.environ.get("CAL_EXTRACTION_MODE", "markdown").strip().lower()
+        if self.EXTRACTION_MODE not in ("markdown", "json"):
+            raise RuntimeError("CAL_EXTRACTION_MODE должен быть markdown или json")
+        # тайлинг высоких скринов: полосы по CAL_TILE_HEIGHT px, извлекаются параллельно
+        self.TILED_EXTRACTION = os.environ.get("CAL_TILED", "") == "1"
+        self.TILE_HEIGHT = int(os.environ.get("CAL_TILE_HEIGHT", "1400"))
+        self.TILE_OVERLAP = int(os.environ.get("CAL_TILE_OVERLAP", "120"))
+        if self.TILE_HEIGHT < 200:
+            raise RuntimeError("CAL_TILE_HEIGHT должен быть не меньше 200")
+        if not 0 <= self.TILE_OVERLAP <= self.TILE_HEIGHT // 4:
+            raise RuntimeError("CAL_TILE_OVERLAP должен быть от 0 до CAL_TILE_HEIGHT/4")
+
         # общий таймаут работы скрипта (сек)
         self.RUN_TIMEOUT = int(os.environ.get("CAL_TIMEOUT", "250"))
 
+        # === CAPTURE-ВОРКЕРЫ ===
+        # local — скринер запускается подпроцессом прямо из бота;
+        # queue — задание кладётся в SQLite-очередь, выполняют capture_worker.py (любое число процессов/машин)
+        self.CAPTURE_MODE = os.environ.get("CAPTURE_MODE", "local").strip().lower()
+        if self.CAPTURE_MODE not in ("local", "queue"):
+            raise RuntimeError("CAPTURE_MODE должен быть local или queue")
+        self.CAPTURE_QUEUE = Path(os.environ.get("CAPTURE_QUEUE", "/var/data/capture_queue.sqlite3"))
+        # сколько задание может ждать свободного воркера сверх своего таймаута (сек)
+        self.CAPTURE_QUEUE_WAIT = int(os.environ.get("CAPTURE_QUEUE_WAIT", "120"))
+        if self.CAPTURE_MODE == "queue":
+            # воркер может быть на другой машине — скрин /calendar должен лежать на общем томе
+            self.OUT_PNG = Path("/var/data/batch/page.png")
+        # воркеры включаются отдельно (только для queue), например строкой в Procfile:
+        #   worker: python capture_worker.py --procs 2
+
+        # === ЗДОРОВЬЕ ИСТОЧНИКОВ ===
+        # адаптивный таймаут = p95 удачных загрузок * CAL_TIMEOUT_MARGIN (не меньше CAL_MIN_TIMEOUT)
+        self.SOURCE_HEALTH = Path(os.environ.get("SOURCE_HEALTH", "/var/data/source_health.json"))
+        # последний удачный скрин каждого источника (по файлу на URL)
+        self.LAST_GOOD_DIR = Path(os.environ.get("LAST_GOOD_DIR", "/var/data/last-good"))
+        self.TIMEOUT_MARGIN = float(os.environ.get("CAL_TIMEOUT_MARGIN", "1.5"))
+        self.MIN_TIMEOUT = int(os.environ.get("CAL_MIN_TIMEOUT", "30"))
+        # после стольких неудач подряд источник пропускается (отдаём последний удачный результат)
+        self.CB_FAIL_THRESHOLD = int(os.environ.get("CB_FAIL_THRESHOLD", "3"))
+        # как часто пробовать открытый источник в фоне (сек)
+        self.CB_COOLDOWN_SEC = int(os.environ.get("CB_COOLDOWN_SEC", "300"))
+
 settings = Settings()
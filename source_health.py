@@ -0,0 +1,167 @@
+# source_health.py
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+from pathlib import Path
+
+HISTORY = 20            # сколько последних удачных замеров хранить на источник
+MIN_SAMPLES = 3         # до стольких замеров — таймаут по умолчанию
+
+
+class SourceHealth:
+    """
+    Здоровье источников (URL из CAL_URLS):
+      - время удачных загрузок -> адаптивный таймаут = p95 * margin (в пределах [min_timeout, max_timeout])
+      - серия неудач >= fail_threshold -> circuit открыт: источник пропускаем и отдаём last-good
+      - пока открыт — раз в cooldown_sec фоновый probe; удачный probe закрывает circuit
+    Состояние хранится в JSON и переживает рестарты; последний удачный скрин —
+    отдельный файл на источник в last_good_dir (не в хранилище debug-дампов).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        last_good_dir: Path,
+        max_timeout: int,
+        min_timeout: int = 30,
+        margin: float = 1.5,
+        fail_threshold: int = 3,
+        cooldown_sec: int = 300,
+    ):
+        self.path = Path(path)
+        self.last_good_dir = Path(last_good_dir)
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.margin = margin
+        self.fail_threshold = fail_threshold
+        self.cooldown_sec = cooldown_sec
+        self._probing: set[str] = set()
+        self._records: dict[str, dict] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            self._records = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            self._records = {}
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(self._records, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[source-health] save fail: {e}")
+
+    def _rec(self, url: str) -> dict:
+        return self._records.setdefault(url, {
+            "durations": [],
+            "streak": 0,
+            "opened_at": None,
+            "last_probe_at": None,
+            "last_ok_at": None,
+            "last_table": None,
+        })
+
+    # --- таймауты ---
+
+    def timeout_for(self, url: str) -> int | None:
+        """Адаптивный таймаут подпроцесса (сек) или None, если истории пока мало."""
+        durations = sorted(self._rec(url)["durations"])
+        if len(durations) < MIN_SAMPLES:
+            return None
+        p95 = durations[min(len(durations) - 1, math.ceil(0.95 * len(durations)) - 1)]
+        return int(min(self.max_timeout, max(self.min_timeout, p95 * self.margin)))
+
+    def capture_limits(self, url: str, slack: int, use_adaptive: bool = True) -> tuple[int | None, int]:
+        """
+        (лимит скрипта для --timeout или None, лимит подпроцесса).
+        Скрипт получает адаптивный таймаут целиком; slack (дампы при ошибке + старт)
+        добавляется только к внешнему лимиту, тот не больше max_timeout.
+        Без истории или при use_adaptive=False — (None, max_timeout): скрипт со своим
+        лимитом по умолчанию.
+        """
+        timeout = self.timeout_for(url) if use_adaptive else None
+        if not timeout:
+            return None, self.max_timeout
+        script_timeout = max(10, min(timeout, self.max_timeout - slack))
+        return script_timeout, min(self.max_timeout, max(timeout, script_timeout) + slack)
+
+    # --- circuit breaker ---
+
+    def is_open(self, url: str) -> bool:
+        return self._rec(url)["opened_at"] is not None
+
+    def should_probe(self, url: str) -> bool:
+        """Пора ли запускать фоновый probe (circuit открыт, cooldown прошёл, probe не идёт)."""
+        rec = self._rec(url)
+        if rec["opened_at"] is None or url in self._probing:
+            return False
+        last = rec["last_probe_at"] or rec["opened_at"]
+        return time.time() - last >= self.cooldown_sec
+
+    def probe_started(self, url: str):
+        self._probing.add(url)
+        self._rec(url)["last_probe_at"] = time.time()
+        self._save()
+
+    def probe_finished(self, url: str):
+        self._probing.discard(url)
+
+    def _last_png(self, url: str) -> Path:
+        return self.last_good_dir / f"{hashlib.sha1(url.encode()).hexdigest()[:12]}.png"
+
+    def record_success(self, url: str, duration: float, png_path: Path | None = None):
+        """Удачный захват: сбрасывает серию, закрывает circuit, копирует скрин как last-good."""
+        rec = self._rec(url)
+        rec["durations"] = (rec["durations"] + [round(duration, 2)])[-HISTORY:]
+        rec["streak"] = 0
+        rec["opened_at"] = None
+        rec["last_ok_at"] = time.time()
+        if png_path is not None:
+            try:
+                dst = self._last_png(url)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+                shutil.copyfile(png_path, tmp)
+                os.replace(tmp, dst)
+            except Exception as e:
+                print(f"[source-health] last-good copy fail: {e}")
+        self._save()
+
+    def record_failure(self, url: str):
+        rec = self._rec(url)
+        rec["streak"] += 1
+        if rec["streak"] >= self.fail_threshold and rec["opened_at"] is None:
+            rec["opened_at"] = time.time()
+            print(f"[source-health] circuit open: {url} (streak={rec['streak']})")
+        self._save()
+
+    def remember_table(self, url: str, table: str):
+        self._rec(url)["last_table"] = table
+        self._save()
+
+    def last_good(self, url: str) -> dict:
+        """{'ts', 'png', 'table'} последнего удачного результата (поля могут быть None)."""
+        rec = self._rec(url)
+        png = self._last_png(url)
+        return {
+            "ts": rec["last_ok_at"],
+            "png": png if png.exists() else None,
+            "table": rec["last_table"],
+        }
+
+    def stats(self) -> dict:
+        return {
+            url: {
+                "samples": len(rec["durations"]),
+                "timeout": self.timeout_for(url),
+                "streak": rec["streak"],
+                "open": rec["opened_at"] is not None,
+            }
+            for url, rec in self._records.items()
+        }
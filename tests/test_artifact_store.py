@@ -0,0 +1,54 @@
+import os
+import time
+
+from artifact_store import ArtifactStore
+
+
+def test_put_dedupes_and_compresses_html(tmp_path):
+    store = ArtifactStore(tmp_path)
+    html = "<html>" + "x" * 5000 + "</html>"
+
+    p1 = store.put_text(html, ".html")
+    p2 = store.put_text(html, ".html")
+    assert p1 == p2
+    assert p1.name.endswith(".html.gz")
+    assert p1.stat().st_size < len(html)
+    assert store.read_bytes(p1).decode() == html
+    assert store.display_name(p1).endswith(".html")
+    assert store.stats()["files"] == 1
+
+
+def test_png_stored_as_is(tmp_path):
+    store = ArtifactStore(tmp_path)
+    p = store.put(b"\x89PNG data", ".png")
+    assert p.suffix == ".png"
+    assert store.read_bytes(p) == b"\x89PNG data"
+
+
+def test_retention_by_size_drops_oldest(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=3000, max_age_sec=0)
+    paths = []
+    for i in range(5):
+        p = store.put(bytes([i]) * 1000, ".png")
+        os.utime(p, (time.time() - 100 + i, time.time() - 100 + i))
+        paths.append(p)
+    store.enforce_retention()
+
+    st = store.stats()
+    assert st["files"] == 3 and st["bytes"] == 3000
+    assert not paths[0].exists() and paths[-1].exists()
+
+
+def test_retention_by_age(tmp_path):
+    store = ArtifactStore(tmp_path, max_bytes=0, max_age_sec=60)
+    old = store.put(b"old", ".png")
+    fresh = store.put(b"fresh", ".png")
+    os.utime(old, (time.time() - 120, time.time() - 120))
+
+    assert store.enforce_retention() == 1
+    assert not old.exists() and fresh.exists()
+
+    # retention выполняется и при каждом put
+    os.utime(fresh, (time.time() - 120, time.time() - 120))
+    store.put(b"newest", ".png")
+    assert not fresh.exists()
@@ -0,0 +1,124 @@
+import sqlite3
+import subprocess
+import threading
+import time
+
+import pytest
+
+import capture_queue
+from capture_queue import CaptureQueue
+from capture_worker import with_own_profile
+
+CMD = ["python", "screenshot_page.py", "--url", "https://example.com", "--out", "/var/data/batch/p.png"]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return CaptureQueue(tmp_path / "queue.sqlite3")
+
+
+def test_claim_is_fifo_and_strips_interpreter(queue, tmp_path):
+    first = queue.enqueue(CMD[2:], 30, tmp_path / "a.log")
+    second = queue.enqueue(CMD[2:], 30, tmp_path / "b.log")
+
+    job = queue.claim("w1")
+    assert job["id"] == first
+    assert queue.get(first)["status"] == "running"
+    assert queue.claim("w2")["id"] == second
+    assert queue.claim("w3") is None
+
+
+def test_complete_sets_status(queue, tmp_path):
+    ok = queue.enqueue([], 30, tmp_path / "a.log")
+    bad = queue.enqueue([], 30, tmp_path / "b.log")
+    queue.claim("w")
+    queue.claim("w")
+    queue.complete(ok, 0)
+    queue.complete(bad, None, "timeout")
+    assert (queue.get(ok)["status"], queue.get(ok)["returncode"]) == ("done", 0)
+    assert (queue.get(bad)["status"], queue.get(bad)["error"]) == ("failed", "timeout")
+
+
+def test_expired_lease_is_requeued_then_failed(queue, tmp_path, monkeypatch):
+    job_id = queue.enqueue([], 10, tmp_path / "a.log")
+    queue.claim("dead-worker")
+
+    # лизинг ещё не истёк — задание никому не отдаётся
+    assert queue.claim("w2") is None
+
+    later = time.time() + capture_queue.LEASE_SLACK + 1
+    monkeypatch.setattr(capture_queue.time, "time", lambda: later)
+    again = queue.claim("w2")
+    assert again["id"] == job_id
+    assert queue.get(job_id)["attempts"] == 2
+
+    # исчерпаны попытки — задание помечается failed, а не крутится вечно
+    much_later = later + capture_queue.LEASE_SLACK + 1
+    monkeypatch.setattr(capture_queue.time, "time", lambda: much_later)
+    assert queue.claim("w3") is None
+    row = queue.get(job_id)
+    assert (row["status"], row["error"]) == ("failed", "lease expired")
+
+
+def test_heartbeat_keeps_long_job_leased(queue, tmp_path, monkeypatch):
+    job_id = queue.enqueue([], 10, tmp_path / "a.log")
+    queue.claim("w1")
+
+    # задание идёт дольше LEASE_SLACK, но воркер жив и шлёт heartbeat
+    now = time.time()
+    for _ in range(3):
+        now += capture_queue.LEASE_SLACK - 1
+        monkeypatch.setattr(capture_queue.time, "time", lambda now=now: now)
+        assert queue.heartbeat(job_id, "w1")
+        assert queue.claim("w2") is None
+    assert queue.get(job_id)["worker"] == "w1"
+
+    # heartbeat от воркера, у которого задание уже забрали, не продлевает чужой лизинг
+    monkeypatch.setattr(capture_queue.time, "time", lambda: now + capture_queue.LEASE_SLACK + 1)
+    assert queue.claim("w2")["id"] == job_id
+    assert not queue.heartbeat(job_id, "w1")
+
+
+def test_old_queue_file_gets_heartbeat_column(tmp_path):
+    path = tmp_path / "queue.sqlite3"
+    db = sqlite3.connect(path)
+    db.executescript(capture_queue.SCHEMA.replace("    heartbeat_at REAL,\n", ""))
+    db.close()
+
+    queue = CaptureQueue(path)
+    job_id = queue.enqueue([], 10, tmp_path / "a.log")
+    assert queue.claim("w")["id"] == job_id
+    assert queue.heartbeat(job_id, "w")
+
+
+def test_run_returns_result_from_worker(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(capture_queue, "POLL_SEC", 0.01)
+
+    def worker():
+        while True:
+            job = queue.claim("w")
+            if job:
+                queue.complete(job["id"], 3)
+                return
+            time.sleep(0.01)
+
+    t = threading.Thread(target=worker)
+    t.start()
+    proc, elapsed = queue.run(CMD, 5, tmp_path / "a.log", 5)
+    t.join()
+    assert proc.returncode == 3 and proc.args == CMD
+    assert elapsed >= 0
+
+
+def test_run_without_worker_times_out_and_cancels(queue, tmp_path, monkeypatch):
+    monkeypatch.setattr(capture_queue, "POLL_SEC", 0.01)
+    with pytest.raises(subprocess.TimeoutExpired):
+        queue.run(CMD, 0, tmp_path / "a.log", 0)
+    assert queue.claim("late-worker") is None
+
+
+def test_worker_slot_gets_own_profile():
+    argv = ["--url", "u", "--user-data-dir", "/var/data/user-data"]
+    assert with_own_profile(argv, "host-1")[-1] == "/var/data/user-data-host-1"
+    assert argv[-1] == "/var/data/user-data"
+    assert with_own_profile(["--url", "u"], "host-1") == ["--url", "u"]
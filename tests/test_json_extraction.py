@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+import ai_analysis
+from ai_analysis import CalendarRow, parse_json_rows, render_markdown
+
+
+def test_parse_valid_rows_pads_and_filters_empty():
+    rows = parse_json_rows(
+        '{"r": [["Mon", "CPI", "3.1%", "3.0%", "2.9%"], ["Mon", "Speech", "", "", ""], ["Tue", "GDP", "1.2%"]]}'
+    )
+    assert rows == [
+        CalendarRow("Mon", "CPI", "3.1%", "3.0%", "2.9%"),
+        CalendarRow("Tue", "GDP", "1.2%", "", ""),
+    ]
+
+
+def test_parse_truncated_keeps_complete_rows():
+    content = '{"r": [["Mon", "CPI", "1", "2", "3"], ["Tue", "GDP", "4", "5", "6"], ["Wed", "PM'
+    rows = parse_json_rows(content)
+    assert [r.name for r in rows] == ["CPI", "GDP"]
+
+
+def test_parse_without_rows_array_raises():
+    with pytest.raises(ValueError):
+        parse_json_rows('{"x": 1}')
+    with pytest.raises(ValueError):
+        parse_json_rows("not json")
+
+
+def test_render_markdown():
+    md = render_markdown([CalendarRow("Mon", "A|B", "1", "", "2")])
+    assert md.splitlines()[0].startswith("| Дата |")
+    assert md.splitlines()[-1] == "| Mon | A/B | 1 |  | 2 |"
+    assert render_markdown([]) == ""
+
+
+class FakeClient:
+    """Отдаёт заранее заданные ответы и запоминает max_tokens запросов."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.budgets = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.budgets.append(kwargs["max_tokens"])
+        content, finish = self.replies.pop(0)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish)],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+
+def test_truncated_reply_is_retried_with_larger_budget():
+    client = FakeClient([
+        ('{"r": [["Mon", "CPI", "1", "2", "3"], ["Tu', "length"),
+        ('{"r": [["Mon", "CPI", "1", "2", "3"], ["Tue", "GDP", "4", "5", "6"]]}', "stop"),
+    ])
+    rows = ai_analysis._request_rows_json(client, b"png", "m", 1500)
+    assert client.budgets == [1500, ai_analysis.JSON_RETRY_MAX_TOKENS]
+    assert len(rows) == 2
+
+
+def test_truncated_retry_falls_back_to_partial_rows():
+    cut = '{"r": [["Mon", "CPI", "1", "2", "3"], ["Tu'
+    client = FakeClient([(cut, "length"), (cut, "length")])
+    rows = ai_analysis._request_rows_json(client, b"png", "m", 1500)
+    assert [r.name for r in rows] == ["CPI"]
+
+
+def test_json_mode_uses_json_system_prompt():
+    client = FakeClient([('{"r": []}', "stop")])
+    seen = []
+    create = client.chat.completions.create
+    client.chat.completions.create = lambda **kw: seen.append(kw["messages"][0]["content"]) or create(**kw)
+    ai_analysis._request_rows_json(client, b"png", "m", 1500)
+    assert seen == [ai_analysis.EXTRACTION_JSON_SYSTEM_PROMPT]
+    assert "только таблица" not in seen[0]
+
+
+def test_stats_split_by_mode_and_tile(monkeypatch):
+    monkeypatch.setattr(ai_analysis, "CALL_LOG", ai_analysis.deque(maxlen=10))
+    resp = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=10))
+    ai_analysis._record_call("json", "m", resp, 1.0, tile=False)
+    ai_analysis._record_call("json", "m", resp, 0.2, tile=True)
+    ai_analysis._record_call("json", "m", resp, 0.4, tile=True)
+
+    stats = ai_analysis.extraction_stats()
+    assert set(stats) == {("json", False), ("json", True)}
+    assert stats[("json", False)]["calls"] == 1
+    assert stats[("json", True)]["avg_latency_ms"] == pytest.approx(300)
@@ -0,0 +1,109 @@
+import time
+
+from source_health import SourceHealth
+
+URL = "https://example.com/calendar"
+
+
+def make(tmp_path, **kw):
+    kw.setdefault("max_timeout", 250)
+    return SourceHealth(tmp_path / "health.json", tmp_path / "last-good", **kw)
+
+
+def test_timeout_needs_history_then_uses_p95_with_margin(tmp_path):
+    h = make(tmp_path, margin=1.5, min_timeout=30)
+    h.record_success(URL, 10)
+    h.record_success(URL, 12)
+    assert h.timeout_for(URL) is None
+
+    h.record_success(URL, 40)
+    assert h.timeout_for(URL) == 60          # p95 = 40, * 1.5
+
+
+def test_timeout_is_clamped(tmp_path):
+    h = make(tmp_path, max_timeout=100, min_timeout=30)
+    for d in (1, 1, 1):
+        h.record_success(URL, d)
+    assert h.timeout_for(URL) == 30
+    for d in (500, 500, 500):
+        h.record_success(URL, d)
+    assert h.timeout_for(URL) == 100
+
+
+def test_circuit_opens_after_streak_and_success_closes(tmp_path):
+    h = make(tmp_path, fail_threshold=3)
+    h.record_failure(URL)
+    h.record_failure(URL)
+    assert not h.is_open(URL)
+    h.record_failure(URL)
+    assert h.is_open(URL)
+
+    h.record_success(URL, 5)
+    assert not h.is_open(URL)
+    assert h.stats()[URL]["streak"] == 0
+
+
+def test_probe_respects_cooldown_and_single_flight(tmp_path):
+    h = make(tmp_path, fail_threshold=1, cooldown_sec=60)
+    assert not h.should_probe(URL)           # circuit закрыт
+    h.record_failure(URL)
+    assert not h.should_probe(URL)           # cooldown ещё не прошёл
+
+    h._rec(URL)["opened_at"] = time.time() - 120
+    assert h.should_probe(URL)
+    h.probe_started(URL)
+    assert not h.should_probe(URL)           # probe уже идёт
+    h.probe_finished(URL)
+    assert not h.should_probe(URL)           # cooldown отсчитывается от последнего probe
+
+
+def test_state_persists_across_instances(tmp_path):
+    h = make(tmp_path, fail_threshold=1)
+    h.record_failure(URL)
+    h.remember_table(URL, "| a |")
+    again = make(tmp_path, fail_threshold=1)
+    assert again.is_open(URL)
+    assert again.last_good(URL)["table"] == "| a |"
+
+
+def test_last_good_png_is_copied_per_source(tmp_path):
+    h = make(tmp_path)
+    assert h.last_good(URL)["png"] is None
+
+    png = tmp_path / "page.png"
+    png.write_bytes(b"first")
+    h.record_success(URL, 5, png)
+    png.write_bytes(b"second")               # исходный файл перезаписывается следующим захватом
+    good = h.last_good(URL)
+    assert good["png"].read_bytes() == b"first"
+    assert good["png"].parent == tmp_path / "last-good"
+    assert good["ts"] is not None
+
+
+def test_script_gets_full_adaptive_timeout(tmp_path):
+    from screenshot_service import build_scraper_cmd
+
+    h = make(tmp_path, max_timeout=250, min_timeout=30, margin=1.5)
+    for d in (20, 22, 25):
+        h.record_success(URL, d)
+
+    script_timeout, run_timeout = h.capture_limits(URL, slack=35)
+    cmd = build_scraper_cmd(
+        "python", tmp_path / "screenshot_page.py", URL, tmp_path / "p.png", tmp_path / "profile",
+        global_timeout=script_timeout,
+    )
+    passed = int(cmd[cmd.index("--timeout") + 1])
+    assert passed >= 25                       # не меньше p95 удачных захватов
+    assert passed == h.timeout_for(URL)
+    assert run_timeout == passed + 35         # запас на дампы — только во внешнем лимите
+
+
+def test_capture_limits_capped_and_default(tmp_path):
+    h = make(tmp_path, max_timeout=100, min_timeout=30)
+    assert h.capture_limits(URL, slack=35) == (None, 100)        # истории нет
+
+    for d in (200, 200, 200):
+        h.record_success(URL, d)
+    script_timeout, run_timeout = h.capture_limits(URL, slack=35)
+    assert run_timeout == 100 and script_timeout == 65
+    assert h.capture_limits(URL, slack=35, use_adaptive=False) == (None, 100)
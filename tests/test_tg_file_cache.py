@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.error import BadRequest  # noqa: E402
+
+from tg_file_cache import FileIdCache  # noqa: E402
+
+
+class FakeBot:
+    """send_photo/send_document: загрузка байт выдаёт новый file_id, file_id из stale — BadRequest."""
+
+    def __init__(self):
+        self.uploads = 0
+        self.stale: set[str] = set()
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        if isinstance(photo, str):
+            if photo in self.stale:
+                raise BadRequest("wrong file identifier")
+            return SimpleNamespace(photo=[SimpleNamespace(file_id=photo)])
+        self.uploads += 1
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id=f"id{self.uploads}")])
+
+    async def send_document(self, chat_id, document, **kwargs):
+        if isinstance(document, str):
+            return SimpleNamespace(document=SimpleNamespace(file_id=document))
+        self.uploads += 1
+        return SimpleNamespace(document=SimpleNamespace(file_id=f"doc{self.uploads}"))
+
+
+def test_repeat_send_goes_by_reference_and_persists(tmp_path):
+    bot = FakeBot()
+    cache = FileIdCache(tmp_path / "ids.json")
+
+    asyncio.run(cache.send_photo(bot, 1, b"png"))
+    asyncio.run(cache.send_photo(bot, 2, b"png"))
+    assert bot.uploads == 1
+    st = cache.stats()
+    assert (st["hits"], st["misses"], st["bytes_saved"]) == (1, 1, 3)
+
+    # после рестарта кэш подхватывается с диска
+    again = FileIdCache(tmp_path / "ids.json")
+    asyncio.run(again.send_photo(bot, 3, b"png"))
+    assert bot.uploads == 1
+
+
+def test_photo_and_document_keys_are_separate(tmp_path):
+    bot = FakeBot()
+    cache = FileIdCache(tmp_path / "ids.json")
+    asyncio.run(cache.send_photo(bot, 1, b"same"))
+    asyncio.run(cache.send_document(bot, 1, b"same", filename="x.png"))
+    assert bot.uploads == 2
+
+
+def test_stale_file_id_falls_back_to_upload(tmp_path):
+    bot = FakeBot()
+    cache = FileIdCache(tmp_path / "ids.json")
+    asyncio.run(cache.send_photo(bot, 1, b"png"))
+    bot.stale.add("id1")
+    asyncio.run(cache.send_photo(bot, 1, b"png"))
+    assert bot.uploads == 2
+
+
+def test_lru_bound(tmp_path):
+    bot = FakeBot()
+    cache = FileIdCache(tmp_path / "ids.json", max_items=2)
+    for data in (b"a", b"b", b"c"):
+        asyncio.run(cache.send_document(bot, 1, data))
+    assert cache.stats()["entries"] == 2
+    asyncio.run(cache.send_document(bot, 1, b"a"))   # вытеснен — грузится заново
+    assert bot.uploads == 4
@@ -0,0 +1,80 @@
+import pytest
+
+import ai_analysis
+from ai_analysis import is_complete_table, merge_strip_tables, split_into_strips
+
+HEADER = "| Дата | Показатель | Факт | Прогноз | Предыдущий |\n|---|---|---:|---:|---:|"
+
+
+def table(*rows):
+    return "\n".join([HEADER] + [f"| {r} |" for r in rows])
+
+
+def test_short_page_is_one_strip():
+    assert split_into_strips(1000, [False] * 1000, 1400, 120) == [(0, 1000)]
+
+
+def test_strips_cover_page_with_overlap_and_cut_at_gaps():
+    h = 6000
+    gaps = [(y % 40) < 3 for y in range(h)]
+    strips = split_into_strips(h, gaps, 1400, 120)
+
+    assert strips[0][0] == 0 and strips[-1][1] == h
+    for (top1, bottom1), (top2, _) in zip(strips, strips[1:]):
+        assert top2 < bottom1            # полосы перекрываются
+        assert top2 > top1               # и продвигаются
+        assert gaps[bottom1] and gaps[top2]
+
+
+def test_strips_without_gaps_still_progress():
+    strips = split_into_strips(5000, [False] * 5000, 1000, 100)
+    assert strips[-1][1] == 5000
+    assert [t for t, _ in strips] == sorted({t for t, _ in strips})
+
+
+@pytest.mark.parametrize("tile_height", [0, 1, 199])
+def test_too_small_tile_height_rejected(tile_height):
+    with pytest.raises(ValueError):
+        split_into_strips(100, [False] * 100, tile_height, 0)
+
+
+def test_merge_drops_only_overlap_rows():
+    merged = merge_strip_tables([
+        table("Mon | CPI | 1 | 2 | 3", "Mon | GDP | 4 | 5 | 6"),
+        table("Mon | GDP | 4 | 5 | 6", "Tue | PMI | 7 | 8 | 9"),
+    ])
+    assert merged.splitlines()[2:] == [
+        "| Mon | CPI | 1 | 2 | 3 |",
+        "| Mon | GDP | 4 | 5 | 6 |",
+        "| Tue | PMI | 7 | 8 | 9 |",
+    ]
+    assert merged.startswith(HEADER)
+
+
+def test_merge_keeps_identical_rows_outside_overlap():
+    # одинаковая строка в начале предыдущей и в конце следующей полосы — это разные строки
+    rep = "— | Speech | — | — | —"
+    merged = merge_strip_tables([
+        table(rep, "Mon | CPI | 1 | 2 | 3"),
+        table("Mon | CPI | 1 | 2 | 3", "Tue | GDP | 4 | 5 | 6", rep),
+    ])
+    body = merged.splitlines()[2:]
+    assert body.count(f"| {rep} |") == 2
+    assert body.count("| Mon | CPI | 1 | 2 | 3 |") == 1
+
+
+def test_merge_empty():
+    assert merge_strip_tables(["", ""]) == ""
+
+
+def test_no_progress_raises_instead_of_looping(monkeypatch):
+    monkeypatch.setattr(ai_analysis, "_nearest_gap", lambda gaps, target, lo, hi: 0)
+    with pytest.raises(RuntimeError):
+        split_into_strips(5000, [False] * 5000, 1000, 100)
+
+
+def test_partial_result_is_not_cacheable():
+    full = table("Mon | CPI | 1 | 2 | 3")
+    assert is_complete_table(full)
+    assert not is_complete_table(full + f"\n\n{ai_analysis.PARTIAL_NOTE} 1 из 3 полос не распознаны: boom")
+    assert not is_complete_table("Нет распознаваемых показателей на скриншоте.")
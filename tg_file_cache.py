@@ -0,0 +1,100 @@
+# tg_file_cache.py
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from telegram.error import BadRequest
+
+
+class FileIdCache:
+    """
+    sha256(байты) -> Telegram file_id первой загрузки.
+    Повторная отправка тех же байт (в любой чат) идёт по ссылке, без аплоада.
+      - LRU-ограничение по числу записей
+      - сохраняется в JSON между рестартами
+      - считает сэкономленные байты и задержку отправки
+    """
+
+    def __init__(self, path: Path, max_items: int = 500):
+        self.path = Path(path)
+        self.max_items = max_items
+        self._ids: OrderedDict[str, str] = OrderedDict()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "bytes_saved": 0,
+            "bytes_uploaded": 0,
+            "upload_sec": 0.0,
+            "ref_sec": 0.0,
+        }
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self._ids = OrderedDict(data.get("ids", []))
+        except Exception:
+            self._ids = OrderedDict()
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"ids": list(self._ids.items())}), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[file-id-cache] save fail: {e}")
+
+    def _remember(self, key: str, file_id: str):
+        self._ids[key] = file_id
+        self._ids.move_to_end(key)
+        while len(self._ids) > self.max_items:
+            self._ids.popitem(last=False)
+        self._save()
+
+    async def _send(self, send, kind: str, data: bytes, **kwargs):
+        # file_id фото нельзя отправить как документ и наоборот — kind входит в ключ
+        key = f"{kind}:{hashlib.sha256(data).hexdigest()}"
+        file_id = self._ids.get(key)
+        if file_id:
+            t0 = time.perf_counter()
+            try:
+                msg = await send(**{kind: file_id}, **kwargs)
+                self._ids.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["bytes_saved"] += len(data)
+                self.counters["ref_sec"] += time.perf_counter() - t0
+                return msg
+            except BadRequest:
+                # file_id протух/невалиден — забываем и грузим заново
+                self._ids.pop(key, None)
+
+        t0 = time.perf_counter()
+        msg = await send(**{kind: data}, **kwargs)
+        self.counters["misses"] += 1
+        self.counters["bytes_uploaded"] += len(data)
+        self.counters["upload_sec"] += time.perf_counter() - t0
+
+        sent = msg.photo[-1] if kind == "photo" and msg.photo else getattr(msg, kind, None)
+        if sent is not None:
+            self._remember(key, sent.file_id)
+        return msg
+
+    async def send_photo(self, bot, chat_id: int, data: bytes, **kwargs):
+        return await self._send(bot.send_photo, "photo", data, chat_id=chat_id, **kwargs)
+
+    async def send_document(self, bot, chat_id: int, data: bytes, **kwargs):
+        return await self._send(bot.send_document, "document", data, chat_id=chat_id, **kwargs)
+
+    def stats(self) -> dict:
+        c = self.counters
+        return {
+            **c,
+            "entries": len(self._ids),
+            "max_items": self.max_items,
+            "avg_upload_ms": c["upload_sec"] / c["misses"] * 1000 if c["misses"] else None,
+            "avg_ref_ms": c["ref_sec"] / c["hits"] * 1000 if c["hits"] else None,
+        }